@@ -1,11 +1,11 @@
 from __future__ import annotations
 
+import gc
 import threading
-import time
 
 import streamlit as st
 
-from state import SharedState, Condition, COLORS
+from state import SharedState, Condition, COLORS, COLOR_HEX, COIN_CODES
 from scraper import run_scraper
 import notifier
 import auth
@@ -20,7 +20,28 @@ CONDITION_TYPES = {
     "Absent for N rolls": "absent_streak",
     "Consecutive streak": "consecutive",
 }
-COLOR_HEX = {"ct": "#2c3e50", "t": "#e67e22", "bonus": "#27ae60"}
+
+
+def _dot_html(color: str, label: str) -> str:
+    return (
+        f'<span style="display:inline-block;width:28px;height:28px;'
+        f"line-height:28px;text-align:center;border-radius:50%;"
+        f'background:{color};color:white;font-size:12px;'
+        f'font-weight:bold;margin:2px;">{label}</span>'
+    )
+
+
+def _last_fired_label(condition: Condition) -> str:
+    if condition.last_fired_at:
+        return f"Last fired: {condition.last_fired_at[:19]}"
+    return "Never fired"
+
+
+# Indexed by coin code (state.COIN_CODES); the last entry is UNKNOWN_COIN
+DOT_HTML = tuple(
+    _dot_html(COLOR_HEX[coin], COLORS[coin][0])
+    for coin in sorted(COIN_CODES, key=COIN_CODES.get)
+) + (_dot_html("#888", "?"),)
 
 
 # ── Singleton scraper start ──────────────────────────────────────────────────
@@ -30,9 +51,19 @@ def get_shared_state() -> SharedState:
     return SharedState()
 
 
+SCRAPER_THREAD_NAME = "siteobserver-scraper"
+
+
 @st.cache_resource
 def start_scraper(_state: SharedState) -> threading.Thread:
-    t = threading.Thread(target=run_scraper, args=(_state,), daemon=True)
+    # cache_resource can be cleared from the app menu; don't start a second
+    # scraper next to one that is still running in this process
+    for t in threading.enumerate():
+        if t.name == SCRAPER_THREAD_NAME and t.is_alive():
+            return t
+    t = threading.Thread(
+        target=run_scraper, args=(_state,), name=SCRAPER_THREAD_NAME, daemon=True
+    )
     t.start()
     return t
 
@@ -43,6 +74,7 @@ start_scraper(state)
 
 # ── Auth helpers ─────────────────────────────────────────────────────────────
 
+@st.fragment
 def _show_auth_form() -> None:
     """Render login/signup forms in the sidebar."""
     tab_login, tab_signup = st.tabs(["Login", "Sign Up"])
@@ -79,8 +111,34 @@ def _show_auth_form() -> None:
                         st.error(msg)
 
 
+@st.fragment
+def _show_account(user_email: str) -> None:
+    """Render Discord ID management and logout for a logged-in user."""
+    st.markdown(f"**Logged in as:** {user_email}")
+
+    # Discord ID management
+    current_discord_id = auth.get_discord_id(user_email) or ""
+    discord_input = st.text_input(
+        "Discord User ID",
+        value=current_discord_id,
+        help="Right-click your profile in Discord > Copy User ID",
+    )
+    if discord_input != current_discord_id:
+        if st.button("Save Discord ID"):
+            auth.set_discord_id(user_email, discord_input)
+            st.success("Discord ID saved")
+            st.rerun()
+
+    if st.button("Logout"):
+        del st.session_state["user_email"]
+        st.rerun()
+
+
 # ── Sidebar ──────────────────────────────────────────────────────────────────
 
+# Login/logout call st.rerun(), so this stays valid for the whole run
+user_email = st.session_state.get("user_email")
+
 with st.sidebar:
     st.title("SiteObserver")
 
@@ -96,28 +154,10 @@ with st.sidebar:
 
     st.divider()
 
-    # Auth section
-    user_email = st.session_state.get("user_email")
-
+    # Auth section — fragments, so typing in these widgets only reruns them.
+    # Login, logout and saving a Discord ID call st.rerun() for a full run.
     if user_email:
-        st.markdown(f"**Logged in as:** {user_email}")
-
-        # Discord ID management
-        current_discord_id = auth.get_discord_id(user_email) or ""
-        discord_input = st.text_input(
-            "Discord User ID",
-            value=current_discord_id,
-            help="Right-click your profile in Discord > Copy User ID",
-        )
-        if discord_input != current_discord_id:
-            if st.button("Save Discord ID"):
-                auth.set_discord_id(user_email, discord_input)
-                st.success("Discord ID saved")
-                st.rerun()
-
-        if st.button("Logout"):
-            del st.session_state["user_email"]
-            st.rerun()
+        _show_account(user_email)
     else:
         _show_auth_form()
 
@@ -135,48 +175,60 @@ tab_rolls, tab_conditions, tab_alerts = st.tabs(
 
 # ── Tab 1: Live rolls (visible to everyone) ──────────────────────────────────
 
-with tab_rolls:
-    rolls = state.get_rolls(100)
-
+def _build_rolls_view(state: SharedState) -> dict | None:
+    """Snapshot everything Tab 1 shows, or None before the first roll."""
+    # One view, so metrics, dots and caption come from the same publish
+    view = state.get_rolls_view()
+    rolls = view.rolls[-100:]
     if not rolls:
+        return None
+    ct, t, bonus = view.distribution
+    coins = view.coins[-100:]
+    return {
+        "index": rolls[-1].index,
+        "metrics": (len(rolls), ct, t, bonus),
+        # All 100 rolls, most recent first
+        "dots": "".join(DOT_HTML[code] for code in coins[::-1]),
+        "caption": (
+            f"Latest roll index: {rolls[-1].index} | "
+            f"Last updated: {rolls[-1].timestamp[:19]}"
+        ),
+    }
+
+
+def render_rolls(state: SharedState) -> None:
+    """Render roll metrics and the last 100 rolls."""
+    # Rebuild only when a new roll arrived; otherwise re-emit the cached view.
+    # Elements must still be emitted each run or the fragment clears them.
+    view = st.session_state.get("rolls_view")
+    if view is None or view["index"] != state.last_index:
+        view = _build_rolls_view(state)
+        st.session_state["rolls_view"] = view
+
+    if view is None:
         st.info("Waiting for scraper to connect and receive rolls...")
-    else:
-        ct = sum(1 for r in rolls if r.coin == "ct")
-        t = sum(1 for r in rolls if r.coin == "t")
-        bonus = sum(1 for r in rolls if r.coin == "bonus")
-        total = len(rolls)
+        return
 
-        col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Total rolls", total)
-        col2.metric("Black (CT)", ct)
-        col3.metric("Orange (T)", t)
-        col4.metric("Green (Bonus)", bonus)
+    total, ct, t, bonus = view["metrics"]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total rolls", total)
+    col2.metric("Black (CT)", ct)
+    col3.metric("Orange (T)", t)
+    col4.metric("Green (Bonus)", bonus)
 
-        # All 100 rolls, most recent first
-        st.subheader("Last 100 rolls")
-        display_rolls = list(reversed(rolls[-100:]))
-        dots = ""
-        for r in display_rolls:
-            color = COLOR_HEX.get(r.coin, "#888")
-            label = COLORS.get(r.coin, "?")[0]
-            dots += (
-                f'<span style="display:inline-block;width:28px;height:28px;'
-                f"line-height:28px;text-align:center;border-radius:50%;"
-                f'background:{color};color:white;font-size:12px;'
-                f'font-weight:bold;margin:2px;">{label}</span>'
-            )
-        st.markdown(dots, unsafe_allow_html=True)
+    st.subheader("Last 100 rolls")
+    st.markdown(view["dots"], unsafe_allow_html=True)
+    st.caption(view["caption"])
 
-        st.caption(
-            f"Latest roll index: {rolls[-1].index} | "
-            f"Last updated: {rolls[-1].timestamp[:19]}"
-        )
+
+with tab_rolls:
+    # Only this fragment reruns on the refresh tick; sidebar and other tabs
+    # are left untouched.
+    st.fragment(render_rolls, run_every="10s" if refresh else None)(state)
 
 # ── Tab 2: Alert conditions (requires login) ────────────────────────────────
 
 with tab_conditions:
-    user_email = st.session_state.get("user_email")
-
     if not user_email:
         st.warning("Please log in to configure alert conditions.")
     else:
@@ -241,27 +293,27 @@ with tab_conditions:
         if not user_conditions:
             st.info("No conditions configured yet.")
         else:
-            for c in user_conditions:
-                col_desc, col_status, col_del = st.columns([4, 2, 1])
-                color_hex = COLOR_HEX.get(c.color, "#888")
-                col_desc.markdown(
-                    f'<span style="color:{color_hex};font-weight:bold;">'
-                    f"{c.description}</span>",
-                    unsafe_allow_html=True,
-                )
-                if c.last_fired_at:
-                    col_status.caption(f"Last fired: {c.last_fired_at[:19]}")
-                else:
-                    col_status.caption("Never fired")
-                if col_del.button("Delete", key=f"del_{c.id}"):
-                    state.remove_condition(c.id, user_email)
-                    st.rerun()
+            # One HTML table instead of a row of widgets per condition
+            rows_html = "".join(
+                f"<tr><td>{c.html}</td><td>{_last_fired_label(c)}</td></tr>"
+                for c in user_conditions
+            )
+            st.markdown(f"<table>{rows_html}</table>", unsafe_allow_html=True)
+
+            descriptions = {c.id: c.description for c in user_conditions}
+            col_select, col_del = st.columns([4, 1], vertical_alignment="bottom")
+            selected_id = col_select.selectbox(
+                "Delete condition",
+                options=list(descriptions),
+                format_func=descriptions.get,
+            )
+            if col_del.button("Delete selected"):
+                state.remove_condition(selected_id, user_email)
+                st.rerun()
 
 # ── Tab 3: Alert log (per-user) ─────────────────────────────────────────────
 
 with tab_alerts:
-    user_email = st.session_state.get("user_email")
-
     if not user_email:
         st.warning("Please log in to view your alert history.")
     else:
@@ -277,8 +329,8 @@ with tab_alerts:
                 if alert.error:
                     st.caption(f"Error: {alert.error}")
 
-# ── Auto-refresh ─────────────────────────────────────────────────────────────
+# ── Cleanup ──────────────────────────────────────────────────────────────────
 
-if refresh:
-    time.sleep(10)
-    st.rerun()
+# Reclaim per-run garbage (widget protos, HTML strings) before the next run.
+# Generation 1 only; a full collection on every run would cost far more.
+gc.collect(1)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import hashlib
+import hmac
 import json
 import logging
 import os
@@ -10,26 +11,96 @@ from pathlib import Path
 logger = logging.getLogger(__name__)
 
 USERS_FILE = Path(__file__).parent / "users.json"
-_lock = threading.Lock()
 
+# scrypt cost parameters for new hashes; stored per user so they can change
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
 
-def _hash_password(password: str, salt: str) -> str:
+# Serialises writers. Readers never take it while users.json is unchanged:
+# they read _cache, which is only ever replaced wholesale, never mutated.
+_write_lock = threading.Lock()
+
+# (st_mtime_ns, users) of the last users.json read or write
+_cache: tuple[int, dict] | None = None
+
+
+def _hash_password(
+    password: str, salt: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P
+) -> str:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=bytes.fromhex(salt), n=n, r=r, p=p, dklen=32
+    ).hex()
+
+
+def _legacy_hash_password(password: str, salt: str) -> str:
+    """Single-round SHA-256 used by records created before scrypt."""
     return hashlib.sha256((salt + password).encode("utf-8")).hexdigest()
 
 
-def _load_users() -> dict:
-    if not USERS_FILE.exists():
+def _password_fields(password: str) -> dict:
+    """Fresh salt, scrypt hash and cost parameters for a user record."""
+    salt = os.urandom(16).hex()
+    return {
+        "password_hash": _hash_password(password, salt),
+        "salt": salt,
+        "n": SCRYPT_N,
+        "r": SCRYPT_R,
+        "p": SCRYPT_P,
+    }
+
+
+def _verify_password(password: str, user: dict) -> bool:
+    if "n" in user:
+        expected = _hash_password(
+            password, user["salt"], user["n"], user["r"], user["p"]
+        )
+    else:
+        expected = _legacy_hash_password(password, user["salt"])
+    return hmac.compare_digest(expected, user["password_hash"])
+
+
+def _load_users_locked() -> dict:
+    """Refresh the cache if users.json changed. Must hold _write_lock."""
+    global _cache
+    try:
+        mtime = USERS_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        _cache = None
         return {}
+    if _cache and _cache[0] == mtime:
+        return _cache[1]
     try:
-        return json.loads(USERS_FILE.read_text(encoding="utf-8"))
+        users = json.loads(USERS_FILE.read_text(encoding="utf-8"))
     except Exception:
         logger.exception("Failed to load users")
         return {}
+    _cache = (mtime, users)
+    return users
+
+
+def _load_users() -> dict:
+    """Return the current users snapshot. Treat the result as read-only."""
+    cache = _cache
+    try:
+        mtime = USERS_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if cache and cache[0] == mtime:
+        return cache[1]
+    with _write_lock:
+        return _load_users_locked()
 
 
 def _save_users(users: dict) -> None:
+    """Write users.json and publish it as the new snapshot. Must hold _write_lock."""
+    global _cache
+    tmp = USERS_FILE.with_suffix(".json.tmp")
     try:
-        USERS_FILE.write_text(json.dumps(users, indent=2), encoding="utf-8")
+        # Write-then-rename so lock-free readers never see a partial file
+        tmp.write_text(json.dumps(users, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, USERS_FILE)
+        _cache = (USERS_FILE.stat().st_mtime_ns, users)
     except Exception:
         logger.exception("Failed to save users")
 
@@ -42,16 +113,14 @@ def signup(email: str, password: str) -> tuple[bool, str]:
     if len(password) < 6:
         return False, "Password must be at least 6 characters"
 
-    with _lock:
-        users = _load_users()
+    fields = _password_fields(password)
+
+    with _write_lock:
+        users = dict(_load_users_locked())
         if email in users:
             return False, "Email already registered"
 
-        salt = os.urandom(16).hex()
-        users[email] = {
-            "password_hash": _hash_password(password, salt),
-            "salt": salt,
-        }
+        users[email] = fields
         _save_users(users)
 
     return True, "Account created successfully"
@@ -61,26 +130,29 @@ def login(email: str, password: str) -> tuple[bool, str]:
     """Authenticate a user. Returns (success, message)."""
     email = email.strip().lower()
 
-    with _lock:
-        users = _load_users()
-
-    user = users.get(email)
+    user = _load_users().get(email)
     if not user:
         return False, "Email not found"
 
-    expected = _hash_password(password, user["salt"])
-    if expected != user["password_hash"]:
+    if not _verify_password(password, user):
         return False, "Incorrect password"
 
+    if "n" not in user:
+        # Upgrade legacy SHA-256 record now that we know the password
+        fields = _password_fields(password)
+        with _write_lock:
+            users = dict(_load_users_locked())
+            if email in users:
+                users[email] = {**users[email], **fields}
+                _save_users(users)
+
     return True, "Login successful"
 
 
 def get_discord_id(email: str) -> str | None:
     """Return the stored Discord user ID for the given email, or None."""
     email = email.strip().lower()
-    with _lock:
-        users = _load_users()
-    user = users.get(email)
+    user = _load_users().get(email)
     if not user:
         return None
     return user.get("discord_id") or None
@@ -91,11 +163,11 @@ def set_discord_id(email: str, discord_id: str) -> tuple[bool, str]:
     email = email.strip().lower()
     discord_id = discord_id.strip()
 
-    with _lock:
-        users = _load_users()
+    with _write_lock:
+        users = dict(_load_users_locked())
         if email not in users:
             return False, "User not found"
-        users[email]["discord_id"] = discord_id
+        users[email] = {**users[email], "discord_id": discord_id}
         _save_users(users)
 
     return True, "Discord ID saved"
@@ -1,53 +1,87 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+import time
+from dataclasses import dataclass
 
-from state import Condition, Roll
+import numpy as np
 
+from state import COIN_CODES, Condition
 
-def evaluate(condition: Condition, rolls: list[Roll]) -> bool:
-    """Evaluate a condition against a list of rolls. Pure function."""
-    if not rolls or not condition.enabled:
+
+@dataclass(slots=True)
+class RollStats:
+    """Summary of the recent coin window, computed once per poll.
+
+    Every check below is a table lookup, so evaluating C conditions costs
+    one pass over the rolls rather than C.
+    """
+    size: int                 # number of rolls in the window
+    tail_counts: np.ndarray   # [k, code]: occurrences of code in the last k rolls
+    absent: np.ndarray        # [code]: trailing rolls without code
+    streak: np.ndarray        # [code]: trailing run length of code
+
+
+def compute_stats(coins: np.ndarray) -> RollStats:
+    """Build RollStats from coin codes ordered oldest first."""
+    size = coins.size
+    n_codes = len(COIN_CODES)
+    if not size:
+        zeros = np.zeros(n_codes, dtype=np.int64)
+        return RollStats(0, np.zeros((1, n_codes), dtype=np.int64), zeros, zeros)
+
+    hits = coins[::-1, None] == np.arange(n_codes)  # newest roll first
+    tail_counts = np.zeros((size + 1, n_codes), dtype=np.int64)
+    np.cumsum(hits, axis=0, out=tail_counts[1:])
+    # argmax finds the first True; columns with none fall back to size
+    absent = np.where(hits.any(axis=0), hits.argmax(axis=0), size)
+    misses = ~hits
+    streak = np.where(misses.any(axis=0), misses.argmax(axis=0), size)
+    return RollStats(size, tail_counts, absent, streak)
+
+
+def evaluate(condition: Condition, stats: RollStats) -> bool:
+    """Evaluate a condition against precomputed roll stats. Pure function."""
+    if not stats.size or not condition.enabled:
+        return False
+    if condition.color not in COIN_CODES:
         return False
 
     if condition.type == "count_below":
-        return _check_count_below(condition, rolls)
+        return _check_count_below(condition, stats)
     if condition.type == "absent_streak":
-        return _check_absent_streak(condition, rolls)
+        return _check_absent_streak(condition, stats)
     if condition.type == "consecutive":
-        return _check_consecutive(condition, rolls)
+        return _check_consecutive(condition, stats)
     return False
 
 
 def is_in_cooldown(condition: Condition) -> bool:
     """Check if a condition is still in its cooldown window."""
-    if not condition.last_fired_at:
-        return False
-    try:
-        last = datetime.fromisoformat(condition.last_fired_at)
-        return datetime.now() - last < timedelta(minutes=condition.cooldown_minutes)
-    except ValueError:
+    if not condition.last_fired_epoch:
         return False
+    return time.time() - condition.last_fired_epoch < condition.cooldown_minutes * 60
 
 
-def _check_count_below(condition: Condition, rolls: list[Roll]) -> bool:
+def _check_count_below(condition: Condition, stats: RollStats) -> bool:
     """True when color count in last N rolls is below threshold."""
-    window = rolls[-condition.param_n:]
-    count = sum(1 for r in window if r.coin == condition.color)
-    return count < condition.param_threshold
+    code = COIN_CODES[condition.color]
+    window = min(condition.param_n, stats.size)
+    return int(stats.tail_counts[window, code]) < condition.param_threshold
 
 
-def _check_absent_streak(condition: Condition, rolls: list[Roll]) -> bool:
+def _check_absent_streak(condition: Condition, stats: RollStats) -> bool:
     """True when color hasn't appeared in the last N rolls."""
-    window = rolls[-condition.param_n:]
-    if len(window) < condition.param_n:
-        return False
-    return all(r.coin != condition.color for r in window)
+    code = COIN_CODES[condition.color]
+    return (
+        stats.size >= condition.param_n
+        and int(stats.absent[code]) >= condition.param_n
+    )
 
 
-def _check_consecutive(condition: Condition, rolls: list[Roll]) -> bool:
+def _check_consecutive(condition: Condition, stats: RollStats) -> bool:
     """True when the last N rolls are all the same color."""
-    if len(rolls) < condition.param_n:
-        return False
-    tail = rolls[-condition.param_n:]
-    return all(r.coin == condition.color for r in tail)
+    code = COIN_CODES[condition.color]
+    return (
+        stats.size >= condition.param_n
+        and int(stats.streak[code]) >= condition.param_n
+    )
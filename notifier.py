@@ -2,12 +2,15 @@ from __future__ import annotations
 
 import logging
 import os
+import threading
 from datetime import datetime
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from state import Condition, Roll, COLORS
+from state import Condition, COLORS
 
 logger = logging.getLogger(__name__)
 
@@ -30,22 +33,65 @@ def _get_bot_token() -> str:
 
 _bot_token: str = _get_bot_token()
 
+# The token is fixed for the process lifetime, so decide this once
+IS_CONFIGURED: bool = bool(_bot_token) and _bot_token != "your_bot_token_here"
+
+_HEADERS = {
+    "Authorization": f"Bot {_bot_token}",
+    "Content-Type": "application/json",
+}
+
+# One keep-alive session for all Discord calls. Opening a DM channel is
+# idempotent, so it also retries transient gateway errors; a message POST may
+# already be delivered when a 5xx or read timeout comes back, so it retries
+# only rate limits (a 429 means Discord did not process it).
+_session = requests.Session()
+_session.headers.update(_HEADERS)
+_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+        ),
+    ),
+)
+_session.mount(
+    f"{DISCORD_API}/channels/",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=2,
+            read=0,
+            backoff_factor=0.2,
+            status_forcelist=(429,),
+            allowed_methods=frozenset({"POST"}),
+        ),
+    ),
+)
+
+# Discord returns the same DM channel for a recipient, so open it once
+_channel_cache: dict[str, str] = {}
+_channel_lock = threading.Lock()
+
 
 def is_configured() -> bool:
-    return bool(_bot_token) and _bot_token != "your_bot_token_here"
+    return IS_CONFIGURED
 
 
-def _build_message(condition: Condition, rolls: list[Roll]) -> str:
-    last_100 = rolls[-100:]
-    ct = sum(1 for r in last_100 if r.coin == "ct")
-    t = sum(1 for r in last_100 if r.coin == "t")
-    bonus = sum(1 for r in last_100 if r.coin == "bonus")
+def _build_message(condition: Condition, distribution: tuple[int, int, int]) -> str:
+    ct, t, bonus = distribution
     now = datetime.now().isoformat(timespec="seconds")
 
     return (
         f"**SiteObserver Alert**\n\n"
         f"Condition triggered: **{condition.description}**\n\n"
-        f"Last {len(last_100)} rolls:\n"
+        f"Last {ct + t + bonus} rolls:\n"
         f"  Black (CT): **{ct}**\n"
         f"  Orange (T): **{t}**\n"
         f"  Green (Bonus): **{bonus}**\n\n"
@@ -54,47 +100,65 @@ def _build_message(condition: Condition, rolls: list[Roll]) -> str:
     )
 
 
+def _open_dm_channel(discord_user_id: str) -> str:
+    """Return the DM channel id for a user, opening it on first use."""
+    channel_id = _channel_cache.get(discord_user_id)
+    if channel_id:
+        return channel_id
+    resp = _session.post(
+        f"{DISCORD_API}/users/@me/channels",
+        json={"recipient_id": discord_user_id},
+        timeout=10,
+    )
+    resp.raise_for_status()
+    channel_id = resp.json()["id"]
+    with _channel_lock:
+        _channel_cache[discord_user_id] = channel_id
+    return channel_id
+
+
+def _post_message(channel_id: str, message: str) -> requests.Response:
+    return _session.post(
+        f"{DISCORD_API}/channels/{channel_id}/messages",
+        json={"content": message},
+        timeout=10,
+    )
+
+
 def send_alert(
     discord_user_id: str,
     condition: Condition,
-    rolls: list[Roll],
+    distribution: tuple[int, int, int],
 ) -> tuple[bool, str]:
-    """Send a Discord DM alert. Returns (success, error_message)."""
+    """Send a Discord DM alert. Returns (success, error_message).
+
+    ``distribution`` is the (ct, t, bonus) count over the last 100 rolls.
+    """
     if not is_configured():
         return False, "DISCORD_BOT_TOKEN not configured"
 
     if not discord_user_id:
         return False, "No Discord user ID set"
 
-    headers = {
-        "Authorization": f"Bot {_bot_token}",
-        "Content-Type": "application/json",
-    }
-
-    # Step 1: Open DM channel
+    # Step 1: Open (or reuse) DM channel
+    cached = discord_user_id in _channel_cache
     try:
-        resp = requests.post(
-            f"{DISCORD_API}/users/@me/channels",
-            json={"recipient_id": discord_user_id},
-            headers=headers,
-            timeout=10,
-        )
-        resp.raise_for_status()
-        channel_id = resp.json()["id"]
+        channel_id = _open_dm_channel(discord_user_id)
     except requests.RequestException as exc:
         error = f"Failed to open DM channel: {exc}"
         logger.error(error)
         return False, error
 
     # Step 2: Send message
-    message = _build_message(condition, rolls)
+    message = _build_message(condition, distribution)
     try:
-        resp = requests.post(
-            f"{DISCORD_API}/channels/{channel_id}/messages",
-            json={"content": message},
-            headers=headers,
-            timeout=10,
-        )
+        resp = _post_message(channel_id, message)
+        if cached and resp.status_code in (401, 404):
+            # Cached channel went stale — reopen it once and retry
+            with _channel_lock:
+                _channel_cache.pop(discord_user_id, None)
+            channel_id = _open_dm_channel(discord_user_id)
+            resp = _post_message(channel_id, message)
         resp.raise_for_status()
         logger.info(
             "Discord DM sent to %s: %s", discord_user_id, condition.description
@@ -2,36 +2,84 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import queue
 import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
 
-from playwright.async_api import async_playwright, Page, Browser
+from playwright.async_api import async_playwright, Page, Browser, JSHandle, Playwright
 
 import auth
 import conditions as cond_engine
 import notifier
-from state import SharedState, Roll, Alert
+from state import SharedState, Roll, Alert, Condition
 
 logger = logging.getLogger(__name__)
 
-POLL_INTERVAL_SECONDS = 15
+# Safety-net poll; new rolls normally arrive through the store watcher
+POLL_INTERVAL_SECONDS = 60
 TARGET_URL = "https://csgoempire.com/roulette"
 
+# Condition checks make blocking HTTP calls, so they run off the Playwright
+# event loop. A single worker keeps evaluations ordered and cooldowns race-free.
+_eval_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conditions")
+
+# Fired alerts wait here for the sender threads; when full, new alerts are
+# logged as failed instead of piling up behind a slow Discord API
+ALERT_QUEUE_SIZE = 256
+ALERT_CONCURRENCY = 8
+_alert_queue: queue.Queue[tuple[Condition, str, tuple[int, int, int]]] = queue.Queue(
+    maxsize=ALERT_QUEUE_SIZE
+)
+
+# Consecutive failed polls before the page is rebuilt by _run_async; failed
+# polls are retried sooner than the regular interval
+MAX_POLL_FAILURES = 5
+POLL_RETRY_SECONDS = 10
+
+# Handle to the (reactive) roulette store module, looked up again whenever a
+# poll fails; null until the store is ready
+JS_ROULETTE = "() => document.querySelector('#app')?.__vue_app__?.config?.globalProperties?.$store?.state?.roulette ?? null"
+
+# Evaluated against the roulette handle; only rolls newer than lastIndex
+# cross the CDP boundary, as compact [index, coin] pairs. Returns null when
+# the store is not ready or the handle no longer is the live store module.
+# "watching" reports whether the live store still has the JS_WATCH watcher.
 JS_POLL = """
-() => {
-    const app = document.querySelector('#app');
-    if (!app || !app.__vue_app__) return null;
-    const store = app.__vue_app__.config.globalProperties.$store;
-    if (!store) return null;
-    const r = store.state.roulette;
+(r, lastIndex) => {
+    const store = document.querySelector('#app')?.__vue_app__?.config?.globalProperties?.$store;
+    if (!r || r !== store?.state?.roulette) return null;
     return {
-        rolls: r.previousRolls.map(x => ({ index: x.index, coin: x.coin })),
+        rolls: r.previousRolls.filter(x => x.index > lastIndex).map(x => [x.index, x.coin]),
         index: r.previousRollsIndex,
-        round: r.round,
-        state: r.roundState
+        watching: !!store.__siteObserverWatching,
     };
 }
 """
 
+# Name of the Python callback exposed to the page
+ROLLS_CALLBACK = "__siteObserverOnRolls"
+
+# Push previousRolls to Python (through the exposed callback, passed in by
+# name) whenever the store's roll index changes. The flag lives on the store,
+# so a reload or a new store is seen as unwatched by JS_POLL.
+JS_WATCH = """
+(callback) => {
+    const store = document.querySelector('#app').__vue_app__.config.globalProperties.$store;
+    if (store.__siteObserverWatching) return;
+    store.__siteObserverWatching = true;
+    store.watch(
+        (s) => s.roulette.previousRollsIndex,
+        (index) => window[callback]({
+            rolls: store.state.roulette.previousRolls.map(x => [x.index, x.coin]),
+            index: index,
+        }),
+    );
+}
+"""
+
 
 async def _accept_cookies(page: Page) -> None:
     try:
@@ -43,27 +91,46 @@ async def _accept_cookies(page: Page) -> None:
         pass
 
 
-async def _poll_once(page: Page, state: SharedState) -> None:
-    data = await page.evaluate(JS_POLL)
+async def _poll_once(page: Page, roulette: JSHandle, state: SharedState) -> bool:
+    """Poll the store through the handle; False if the handle is unusable."""
+    data = await roulette.evaluate(JS_POLL, state.last_index)
     if data is None:
-        logger.warning("Vuex store not accessible yet")
-        return
+        return False
+    if not data.get("watching"):
+        # Page reloaded or store replaced: the push watcher went with it
+        logger.info("Re-installing the store watcher")
+        await page.evaluate(JS_WATCH, ROLLS_CALLBACK)
+    _ingest_rolls(data, state)
+    return True
+
+
+def _on_rolls(data: dict, state: SharedState) -> None:
+    """Store-watcher callback, invoked by the page on each new roll."""
+    try:
+        _ingest_rolls(data, state)
+    except Exception:
+        logger.exception("Error handling pushed rolls")
+
 
+def _ingest_rolls(data: dict, state: SharedState) -> None:
+    """Add rolls from a JS_POLL/JS_WATCH payload; rolls are [index, coin]."""
     raw_rolls = data.get("rolls", [])
     server_index = data.get("index", 0)
 
     if server_index <= state.last_index and state.last_index > 0:
         return
 
+    # One timestamp per batch rather than one datetime.now() per Roll
+    now = datetime.now().isoformat()
     new_rolls = [
-        Roll(index=r["index"], coin=r["coin"])
-        for r in raw_rolls
-        if r["index"] > state.last_index
+        Roll(index=index, coin=coin, timestamp=now)
+        for index, coin in raw_rolls
+        if index > state.last_index
     ]
 
     if not new_rolls:
         if state.last_index == 0 and raw_rolls:
-            seed = [Roll(index=r["index"], coin=r["coin"]) for r in raw_rolls]
+            seed = [Roll(index=index, coin=coin, timestamp=now) for index, coin in raw_rolls]
             state.add_rolls(seed)
             logger.info("Seeded %d historical rolls", len(seed))
         return
@@ -75,51 +142,119 @@ async def _poll_once(page: Page, state: SharedState) -> None:
             len(added), state.last_index,
         )
 
-    _evaluate_conditions(state)
+    _schedule_evaluation(state)
+
+
+def _schedule_evaluation(state: SharedState) -> None:
+    future = _eval_executor.submit(_evaluate_conditions, state)
+    future.add_done_callback(_log_evaluation_error)
+
+
+def _log_evaluation_error(future: Future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        logger.error("Error evaluating conditions", exc_info=exc)
 
 
 def _evaluate_conditions(state: SharedState) -> None:
-    rolls = state.get_rolls(100)
+    coins, distribution, conditions = state.snapshot_for_eval(100)
+    stats = cond_engine.compute_stats(coins)
+
+    triggered = [
+        c for c in conditions
+        if c.enabled
+        and not cond_engine.is_in_cooldown(c)
+        and cond_engine.evaluate(c, stats)
+    ]
+    if not triggered:
+        return
 
-    for condition in state.get_all_conditions():
-        if not condition.enabled:
-            continue
-        if cond_engine.is_in_cooldown(condition):
-            continue
-        if not cond_engine.evaluate(condition, rolls):
-            continue
+    # Start the cooldowns now; the DMs themselves are sent by alert workers
+    state.apply_fires([c.id for c in triggered])
 
+    for condition in triggered:
         logger.info("Condition triggered: %s (user: %s)", condition.description, condition.user_email)
 
-        success, error = False, "No Discord ID configured"
         discord_id = auth.get_discord_id(condition.user_email) if condition.user_email else None
         if discord_id and notifier.is_configured():
-            success, error = notifier.send_alert(discord_id, condition, rolls)
-        elif not discord_id:
+            try:
+                _alert_queue.put_nowait((condition, discord_id, distribution))
+            except queue.Full:
+                logger.warning("Alert queue full, dropping alert: %s", condition.description)
+                _record_alert(state, condition, False, "Alert queue full")
+            continue
+        if not discord_id:
             logger.warning("No Discord ID for user %s, skipping notification", condition.user_email)
+        _record_alert(state, condition, False, "No Discord ID configured")
+
+
+def _record_alert(state: SharedState, condition: Condition, success: bool, error: str) -> None:
+    state.add_alert(Alert(
+        condition_id=condition.id,
+        condition_desc=condition.description,
+        user_email=condition.user_email,
+        email_sent=success,
+        error=error,
+    ))
+
+
+def _alert_worker(state: SharedState) -> None:
+    """Send queued alerts forever. ALERT_CONCURRENCY of these run in parallel."""
+    while True:
+        condition, discord_id, distribution = _alert_queue.get()
+        try:
+            success, error = notifier.send_alert(discord_id, condition, distribution)
+        except Exception as exc:
+            logger.exception("Error sending alert")
+            success, error = False, str(exc)
+        _record_alert(state, condition, success, error)
+
 
-        state.update_condition_fired(condition.id)
-        state.add_alert(Alert(
-            condition_id=condition.id,
-            condition_desc=condition.description,
-            user_email=condition.user_email,
-            email_sent=success,
-            error=error,
-        ))
+def _start_alert_workers(state: SharedState) -> None:
+    for i in range(ALERT_CONCURRENCY):
+        threading.Thread(
+            target=_alert_worker, args=(state,), name=f"alert-{i}", daemon=True
+        ).start()
 
 
 async def _run_scraper_loop(page: Page, state: SharedState) -> None:
+    """Poll forever; raises after MAX_POLL_FAILURES so the page is rebuilt.
+
+    The roulette handle dies with a reload and goes stale if the store module
+    is replaced, so it is looked up again after every failed poll.
+    """
     state.set_scraper_status("running")
+    roulette: JSHandle | None = None
+    failures = 0
     while True:
         try:
-            await _poll_once(page, state)
+            if roulette is None:
+                roulette = await page.evaluate_handle(JS_ROULETTE)
+            ok = await _poll_once(page, roulette, state)
+            if not ok:
+                logger.warning("Roulette store not ready or replaced")
         except Exception:
             logger.exception("Error during poll")
-        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            ok = False
+        if ok:
+            failures = 0
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            continue
+
+        failures += 1
+        if failures >= MAX_POLL_FAILURES:
+            raise RuntimeError(f"{failures} consecutive polls failed")
+        if roulette is not None:
+            try:
+                await roulette.dispose()
+            except Exception:
+                pass
+            roulette = None
+        await asyncio.sleep(POLL_RETRY_SECONDS)
 
 
-def _ensure_browser_installed() -> None:
-    """Install Chromium if not already present (needed on Streamlit Cloud)."""
+def _install_browser() -> None:
+    """Install Chromium (needed on Streamlit Cloud)."""
     try:
         subprocess.run(
             ["playwright", "install", "chromium"],
@@ -131,18 +266,31 @@ def _ensure_browser_installed() -> None:
 
 
 async def _run_async(state: SharedState) -> None:
-    """Async entry point — connects Playwright and polls forever."""
-    _ensure_browser_installed()
+    """Async entry point — connects Playwright and polls forever.
 
+    Playwright and the browser survive restarts; only the page is replaced,
+    unless the browser itself has gone away.
+    """
+    pw: Playwright | None = None
+    browser: Browser | None = None
     while True:
-        browser: Browser | None = None
+        page: Page | None = None
         try:
-            logger.info("Starting Playwright browser")
             state.set_scraper_status("starting")
 
-            pw = await async_playwright().start()
-            browser = await pw.chromium.launch(headless=True)
+            if pw is None:
+                pw = await async_playwright().start()
+                # The revision this Playwright version launches; an older
+                # download left in the cache does not count
+                if not Path(pw.chromium.executable_path).exists():
+                    _install_browser()
+            if browser is None or not browser.is_connected():
+                logger.info("Starting Playwright browser")
+                browser = await pw.chromium.launch(headless=True)
             page = await browser.new_page()
+            await page.expose_function(
+                ROLLS_CALLBACK, lambda data: _on_rolls(data, state)
+            )
 
             logger.info("Navigating to %s", TARGET_URL)
             await page.goto(TARGET_URL, wait_until="networkidle", timeout=60000)
@@ -152,7 +300,8 @@ async def _run_async(state: SharedState) -> None:
                 "() => document.querySelector('#app')?.__vue_app__?.config?.globalProperties?.$store?.state?.roulette?.previousRolls?.length > 0",
                 timeout=30000,
             )
-            logger.info("Vuex store ready, starting poll loop")
+            await page.evaluate(JS_WATCH, ROLLS_CALLBACK)
+            logger.info("Vuex store ready, watching rolls")
 
             await _run_scraper_loop(page, state)
 
@@ -161,12 +310,25 @@ async def _run_async(state: SharedState) -> None:
             logger.exception("Scraper crashed, restarting in 30s")
             state.set_scraper_status("error", error_msg)
 
-            if browser:
+            if "Executable doesn't exist" in error_msg:
+                # e.g. the headless shell is missing; install before retrying
+                _install_browser()
+
+            if page:
                 try:
-                    await browser.close()
+                    await page.close()
                 except Exception:
                     pass
 
+            if browser is None or not browser.is_connected():
+                # The driver may have died with the browser; start it afresh
+                if pw is not None:
+                    try:
+                        await pw.stop()
+                    except Exception:
+                        pass
+                pw = browser = None
+
             await asyncio.sleep(30)
 
 
@@ -184,4 +346,5 @@ def run_scraper(state: SharedState) -> None:
     else:
         loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    _start_alert_workers(state)
     loop.run_until_complete(_run_async(state))
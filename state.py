@@ -1,21 +1,52 @@
 from __future__ import annotations
 
+import atexit
+import itertools
 import json
 import logging
+import os
+import queue
 import threading
-import uuid
-from dataclasses import dataclass, asdict
+import time
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; stdlib json is used without it
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
 PERSIST_FILE = Path(__file__).parent / "state.json"
 
 COLORS = {"ct": "Black", "t": "Orange", "bonus": "Green"}
+COLOR_HEX = {"ct": "#2c3e50", "t": "#e67e22", "bonus": "#27ae60"}
+COIN_CODES = {"ct": 0, "t": 1, "bonus": 2}
+UNKNOWN_COIN = 3  # code for coins outside COIN_CODES
+
+ROLLS_CAP = 200
+ALERTS_CAP = 500
+SAVE_DEBOUNCE_SECONDS = 0.2  # coalesce bursts of condition changes into one write
+DIST_WINDOW = 100  # rolls covered by get_last100_distribution()
+
+# Ids are a per-process random prefix plus a counter: unique without a
+# urandom call per object. Condition ids outlive the process (state.json),
+# so the prefix is wide enough that restarts don't reuse one.
+_id_prefix = os.urandom(4).hex()
+_id_counter = itertools.count(1)
+
 
+def _new_id() -> str:
+    return f"{_id_prefix}{next(_id_counter):x}"
 
-@dataclass
+
+@dataclass(slots=True)
 class Roll:
     index: int
     coin: str  # "ct", "t", "bonus"
@@ -30,7 +61,7 @@ class Roll:
         return COLORS.get(self.coin, self.coin)
 
 
-@dataclass
+@dataclass(slots=True)
 class Condition:
     id: str = ""
     color: str = ""          # "ct", "t", "bonus"
@@ -41,13 +72,46 @@ class Condition:
     last_fired_at: str = ""
     enabled: bool = True
     user_email: str = ""     # owner of this condition
+    last_fired_epoch: float = 0.0  # time.time() of last_fired_at, for cooldowns
+    # Derived once in __post_init__; slots rule out cached_property
+    description: str = field(init=False, repr=False, compare=False)
+    html: str = field(init=False, repr=False, compare=False)
 
     def __post_init__(self) -> None:
         if not self.id:
-            self.id = uuid.uuid4().hex[:8]
-
-    @property
-    def description(self) -> str:
+            self.id = _new_id()
+        self.description = self._describe()
+        color_hex = COLOR_HEX.get(self.color, "#888")
+        # Description as a colored HTML badge
+        self.html = (
+            f'<span style="color:{color_hex};font-weight:bold;">'
+            f"{self.description}</span>"
+        )
+        if self.last_fired_at and not self.last_fired_epoch:
+            # Conditions persisted before last_fired_epoch existed
+            try:
+                self.last_fired_epoch = datetime.fromisoformat(
+                    self.last_fired_at
+                ).timestamp()
+            except ValueError:
+                pass
+
+    def to_dict(self) -> dict:
+        """Persisted fields only; cheaper than dataclasses.asdict()."""
+        return {
+            "id": self.id,
+            "color": self.color,
+            "type": self.type,
+            "param_n": self.param_n,
+            "param_threshold": self.param_threshold,
+            "cooldown_minutes": self.cooldown_minutes,
+            "last_fired_at": self.last_fired_at,
+            "enabled": self.enabled,
+            "user_email": self.user_email,
+            "last_fired_epoch": self.last_fired_epoch,
+        }
+
+    def _describe(self) -> str:
         color = COLORS.get(self.color, self.color)
         if self.type == "count_below":
             return f"{color} count < {self.param_threshold} in last {self.param_n} rolls"
@@ -58,7 +122,7 @@ class Condition:
         return f"Unknown condition type: {self.type}"
 
 
-@dataclass
+@dataclass(slots=True)
 class Alert:
     id: str = ""
     condition_id: str = ""
@@ -70,11 +134,22 @@ class Alert:
 
     def __post_init__(self) -> None:
         if not self.id:
-            self.id = uuid.uuid4().hex[:8]
+            self.id = _new_id()
         if not self.fired_at:
             self.fired_at = datetime.now().isoformat()
 
 
+_EMPTY_COINS = np.zeros(0, dtype=np.uint8)
+_EMPTY_COINS.setflags(write=False)
+
+
+class _RollsView(NamedTuple):
+    """Rolls, their coin codes and last-100 counts, published together."""
+    rolls: tuple[Roll, ...]
+    coins: np.ndarray
+    distribution: tuple[int, int, int]
+
+
 class SharedState:
     _instance: SharedState | None = None
     _lock = threading.Lock()
@@ -90,36 +165,113 @@ class SharedState:
             return
         self._initialized = True
         self._data_lock = threading.Lock()
-        self.rolls: list[Roll] = []
+        self.rolls: deque[Roll] = deque(maxlen=ROLLS_CAP)
         self.last_index: int = 0
+        # Coin codes of self.rolls, kept as a ring buffer for vectorised checks
+        self._coin_codes = np.zeros(ROLLS_CAP, dtype=np.uint8)
+        self._head: int = 0  # total number of codes ever written
+        # Per-code counts over the last DIST_WINDOW rolls (index UNKNOWN_COIN too)
+        self._dist = [0] * (UNKNOWN_COIN + 1)
         self.conditions: list[Condition] = []
-        self.alerts: list[Alert] = []
+        # Indices over self.conditions; kept in sync by the condition methods
+        self._cond_by_id: dict[str, Condition] = {}
+        self._cond_by_user: dict[str, list[Condition]] = {}
+        self.alerts: deque[Alert] = deque(maxlen=ALERTS_CAP)
         self.scraper_status: str = "stopped"
         self.scraper_error: str = ""
+        # Read-only views published by the writers (under _data_lock) so the
+        # getters can read them without locking: each is replaced wholesale,
+        # never mutated, and a CPython attribute read is atomic
+        self._rolls_view: _RollsView = _RollsView((), _EMPTY_COINS, (0, 0, 0))
+        self._conditions_view: tuple[Condition, ...] = ()
+        self._user_conditions_view: dict[str, tuple[Condition, ...]] = {}
+        self._alerts_view: tuple[Alert, ...] = ()
+        self._status_view: tuple[str, str] = ("stopped", "")
+        # Persistence: _save() queues (seq, bytes) snapshots, latest wins, and
+        # a single writer thread puts them on disk
+        self._save_queue: queue.Queue[tuple[int, bytes]] = queue.Queue(maxsize=1)
+        self._save_seq: int = 0      # last snapshot taken, under _data_lock
+        self._written_seq: int = 0   # last snapshot on disk, under _write_lock
+        self._write_lock = threading.Lock()
         self._load()
+        threading.Thread(
+            target=self._writer_loop, name="state-writer", daemon=True
+        ).start()
+        atexit.register(self.flush_now)
 
     def _load(self) -> None:
         if not PERSIST_FILE.exists():
             return
         try:
-            data = json.loads(PERSIST_FILE.read_text(encoding="utf-8"))
+            raw = PERSIST_FILE.read_bytes()
+            data = orjson.loads(raw) if orjson else json.loads(raw)
             self.conditions = [
                 Condition(**c) for c in data.get("conditions", [])
             ]
+            for c in self.conditions:
+                self._index_condition(c)
+            self._publish_conditions()
             logger.info("Loaded %d conditions from %s", len(self.conditions), PERSIST_FILE)
         except Exception:
             logger.exception("Failed to load persisted state")
 
+    def _snapshot(self) -> tuple[int, bytes]:
+        """Serialise the conditions. Call with _data_lock held."""
+        self._save_seq += 1
+        data = {
+            "conditions": [c.to_dict() for c in self.conditions],
+        }
+        if orjson:
+            return self._save_seq, orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        return self._save_seq, json.dumps(data, indent=2).encode("utf-8")
+
     def _save(self) -> None:
+        """Hand a snapshot to the writer thread. Call with _data_lock held."""
         try:
-            data = {
-                "conditions": [asdict(c) for c in self.conditions],
-            }
-            PERSIST_FILE.write_text(
-                json.dumps(data, indent=2), encoding="utf-8"
-            )
+            snapshot = self._snapshot()
         except Exception:
-            logger.exception("Failed to save state")
+            logger.exception("Failed to serialise state")
+            return
+        try:
+            self._save_queue.put_nowait(snapshot)
+        except queue.Full:
+            # Replace the pending snapshot; only the newest one matters
+            try:
+                self._save_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._save_queue.put_nowait(snapshot)
+
+    def _writer_loop(self) -> None:
+        while True:
+            snapshot = self._save_queue.get()
+            # Let a burst of changes settle, then write only the newest
+            time.sleep(SAVE_DEBOUNCE_SECONDS)
+            try:
+                snapshot = self._save_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._write(*snapshot)
+
+    def flush_now(self) -> None:
+        """Write any pending changes immediately (used at shutdown)."""
+        with self._data_lock:
+            if self._save_seq == self._written_seq:
+                return
+            snapshot = self._snapshot()
+        self._write(*snapshot)
+
+    def _write(self, seq: int, buf: bytes) -> None:
+        with self._write_lock:
+            if seq <= self._written_seq:
+                return  # a newer snapshot is already on disk
+            tmp = PERSIST_FILE.with_suffix(".json.tmp")
+            try:
+                tmp.write_bytes(buf)
+                os.replace(tmp, PERSIST_FILE)
+                self._written_seq = seq
+            except Exception:
+                logger.exception("Failed to save state")
 
     # ── Rolls (global, shared across all users) ──────────────────────────
 
@@ -131,61 +283,124 @@ class SharedState:
                     self.rolls.append(roll)
                     self.last_index = roll.index
                     added.append(roll)
-            if len(self.rolls) > 200:
-                self.rolls = self.rolls[-200:]
+                    code = COIN_CODES.get(roll.coin, UNKNOWN_COIN)
+                    self._coin_codes[self._head % ROLLS_CAP] = code
+                    self._dist[code] += 1
+                    if self._head >= DIST_WINDOW:
+                        dropped = self._coin_codes[(self._head - DIST_WINDOW) % ROLLS_CAP]
+                        self._dist[dropped] -= 1
+                    self._head += 1
+            if added:
+                self._publish_rolls()
             return added
 
-    def get_rolls(self, n: int = 100) -> list[Roll]:
-        with self._data_lock:
-            return list(self.rolls[-n:])
+    def _publish_rolls(self) -> None:
+        n = min(self._head, ROLLS_CAP)
+        coins = self._coin_codes.take(
+            np.arange(self._head - n, self._head), mode="wrap"
+        )
+        coins.setflags(write=False)
+        self._rolls_view = _RollsView(
+            tuple(self.rolls), coins, tuple(self._dist[:UNKNOWN_COIN])
+        )
+
+    def get_rolls_view(self) -> _RollsView:
+        """Rolls, coin codes and last-100 counts from one consistent publish."""
+        return self._rolls_view
+
+    def get_rolls(self, n: int = 100) -> tuple[Roll, ...]:
+        return self._rolls_view.rolls[-n:] if n > 0 else ()
+
+    def get_coin_window(self, n: int = 100) -> np.ndarray:
+        """Return coin codes of the last n rolls, oldest first (read-only)."""
+        return self._rolls_view.coins[-n:] if n > 0 else _EMPTY_COINS
+
+    def get_last100_distribution(self) -> tuple[int, int, int]:
+        """Return (ct, t, bonus) counts over the last 100 rolls."""
+        return self._rolls_view.distribution
 
     # ── Conditions (per-user) ────────────────────────────────────────────
 
+    def _index_condition(self, condition: Condition) -> None:
+        self._cond_by_id[condition.id] = condition
+        self._cond_by_user.setdefault(condition.user_email, []).append(condition)
+
+    def _publish_conditions(self) -> None:
+        self._conditions_view = tuple(self.conditions)
+        self._user_conditions_view = {
+            user: tuple(conds) for user, conds in self._cond_by_user.items()
+        }
+
     def add_condition(self, condition: Condition) -> None:
         with self._data_lock:
             self.conditions.append(condition)
+            self._index_condition(condition)
+            self._publish_conditions()
             self._save()
 
     def remove_condition(self, condition_id: str, user_email: str) -> None:
         with self._data_lock:
-            self.conditions = [
-                c for c in self.conditions
-                if not (c.id == condition_id and c.user_email == user_email)
-            ]
+            c = self._cond_by_id.get(condition_id)
+            if c is None or c.user_email != user_email:
+                return
+            del self._cond_by_id[condition_id]
+            self._cond_by_user[user_email].remove(c)
+            self.conditions.remove(c)
+            self._publish_conditions()
             self._save()
 
-    def get_conditions(self, user_email: str | None = None) -> list[Condition]:
-        with self._data_lock:
-            if user_email is None:
-                return list(self.conditions)
-            return [c for c in self.conditions if c.user_email == user_email]
+    def get_conditions(self, user_email: str | None = None) -> tuple[Condition, ...]:
+        if user_email is None:
+            return self._conditions_view
+        return self._user_conditions_view.get(user_email, ())
 
-    def get_all_conditions(self) -> list[Condition]:
-        with self._data_lock:
-            return list(self.conditions)
+    def get_all_conditions(self) -> tuple[Condition, ...]:
+        return self._conditions_view
 
     def update_condition_fired(self, condition_id: str) -> None:
+        self.apply_fires([condition_id])
+
+    def apply_fires(self, condition_ids: list[str]) -> None:
+        """Mark several conditions fired under one lock and one save."""
+        if not condition_ids:
+            return
+        now = time.time()
+        fired_at = datetime.fromtimestamp(now).isoformat()
         with self._data_lock:
-            for c in self.conditions:
-                if c.id == condition_id:
-                    c.last_fired_at = datetime.now().isoformat()
-                    break
-            self._save()
+            changed = False
+            for condition_id in condition_ids:
+                c = self._cond_by_id.get(condition_id)
+                if c is None:
+                    continue
+                c.last_fired_epoch = now
+                c.last_fired_at = fired_at
+                changed = True
+            if changed:
+                self._save()
+
+    # ── Evaluation snapshot ──────────────────────────────────────────────
+
+    def snapshot_for_eval(
+        self, n: int = 100
+    ) -> tuple[np.ndarray, tuple[int, int, int], tuple[Condition, ...]]:
+        """Coin window, last-100 distribution and conditions, without locking."""
+        view = self._rolls_view
+        return view.coins[-n:], view.distribution, self._conditions_view
 
     # ── Alerts (per-user) ────────────────────────────────────────────────
 
     def add_alert(self, alert: Alert) -> None:
         with self._data_lock:
             self.alerts.append(alert)
-            if len(self.alerts) > 500:
-                self.alerts = self.alerts[-500:]
+            self._alerts_view = tuple(self.alerts)
 
     def get_alerts(self, user_email: str | None = None, n: int = 50) -> list[Alert]:
-        with self._data_lock:
-            if user_email is None:
-                return list(self.alerts[-n:])
-            user_alerts = [a for a in self.alerts if a.user_email == user_email]
-            return user_alerts[-n:]
+        newest = reversed(self._alerts_view)
+        if user_email is not None:
+            newest = (a for a in newest if a.user_email == user_email)
+        alerts = list(itertools.islice(newest, n))
+        alerts.reverse()
+        return alerts
 
     # ── Scraper status ───────────────────────────────────────────────────
 
@@ -193,7 +408,7 @@ class SharedState:
         with self._data_lock:
             self.scraper_status = status
             self.scraper_error = error
+            self._status_view = (status, error)
 
     def get_scraper_status(self) -> tuple[str, str]:
-        with self._data_lock:
-            return self.scraper_status, self.scraper_error
+        return self._status_view